@@ -1,17 +1,69 @@
+import argparse
+import functools
+import mmap
+import os
+import select
 import socket
 import struct
 import pygame
 import sys
+import threading
 
-# Doom Resolution
+# Not on Windows; only used to skip frames that are already stale
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
+
+# Optional: NumPy lets us write frames straight into the window's pixels,
+# Numba additionally fuses the BGR->RGB swap and the upscale into one pass
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = np is not None
+except ImportError:
+    HAVE_NUMBA = False
+
+# Doom Resolution (defaults for --width/--height)
 WIDTH = 640
 HEIGHT = 400
-# 24-bit Color (BGR)
-TOTAL_BYTES = WIDTH * HEIGHT * 3
+# Integer window upscale (default for --scale). 0 keeps a native-resolution
+# surface and lets SDL scale it on the GPU (pygame.SCALED).
+SCALE = 0
+# Wire formats: 24-bit BGR (default) or 16-bit RGB565 little endian
+# (--bpp 16, server started with -rgb565)
+RGB565_MASKS = (0xF800, 0x07E0, 0x001F, 0)
 
 # Network Config
 SERVER_IP = "192.168.3.4" 
 SERVER_PORT = 5000
+# Kernel receive buffer. Big enough that one recv_into drains tens of KB
+# instead of a few segments. Linux caps this at net.core.rmem_max, so raise
+# that too (sysctl -w net.core.rmem_max=4194304) if the request is clamped.
+RCVBUF_BYTES = 1 << 20
+# Let the kernel wait for the whole frame so we wake up once per frame.
+# Not every platform defines it; 0 falls back to plain partial reads.
+MSG_WAITALL = getattr(socket, "MSG_WAITALL", 0)
+# Linux only (value from asm-generic/socket.h where Python lacks the name)
+SO_INCOMING_CPU = getattr(socket, "SO_INCOMING_CPU", 49)
+# UDP frame stream (--udp). The server splits each frame into datagrams of
+# FRAME_HDR + up to UDP_CHUNK_BYTES of pixels, header little endian
+# (frame_id u32, chunk_idx u16, chunk_count u16); chunk i carries frame
+# bytes [i * UDP_CHUNK_BYTES, ...). After the TCP connect the viewer sends
+# UDP_HELLO from its UDP socket to the server port so the server learns
+# where to stream; TCP then only carries key events.
+FRAME_HDR = struct.Struct("<IHH")
+UDP_CHUNK_BYTES = 1400
+UDP_RCVBUF_BYTES = 4 << 20
+UDP_HELLO = b"DOOM"
+# Frame slots in the receive ring (triple buffering)
+RING_SLOTS = 3
+# How long the render loop waits for a frame before pumping input again
+FRAME_WAIT_S = 0.01
 
 KEY_MAP = {
     pygame.K_LEFT: 0xac,
@@ -34,66 +86,429 @@ KEY_MAP = {
     pygame.K_ESCAPE: 27,
 }
 
-def recvall(sock, n):
-    data = bytearray()
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
+def recv_frame(sock, mv, n):
+    # Fill mv[0:n] in place; returns False if the server hung up mid-frame.
+    # With MSG_WAITALL this is normally a single syscall; the loop only
+    # runs again if the wait is cut short (signal, shutdown).
+    # An io_uring READ_FIXED would still cost one io_uring_enter per frame
+    # for a single stream, so it is not worth a Linux-only dependency here.
+    off = 0
+    while off < n:
+        k = sock.recv_into(mv[off:n], n - off, MSG_WAITALL)
+        if not k:
+            return False
+        off += k
+    return True
+
+if HAVE_NUMBA:
+    @functools.lru_cache(maxsize=None)
+    def make_render(width, height, scale, packing=None):
+        # Compiles render(src, dst) for one stream geometry. width, height and
+        # scale are closure constants, so Numba sees fixed trip counts and can
+        # unroll and vectorise the inner loops. src is the received frame as
+        # (height, width, 3) BGR.
+        #
+        # packing=None: dst is get_view('3') of the window, indexed [x, y] RGB.
+        # packing=(rshift, gshift, bshift, amask): faster variant for 32-bit
+        # windows. dst is get_view('2'), one mapped pixel int per [x, y]; each
+        # pixel is swizzled into a single 32-bit store, and the first output
+        # row of each source row is copied to the other scale - 1 rows as
+        # contiguous runs.
+        if packing is None:
+            @njit(parallel=True, fastmath=True, boundscheck=False, nogil=True)
+            def render(src, dst):
+                for y in prange(height):
+                    for x in range(width):
+                        b = src[y, x, 0]
+                        g = src[y, x, 1]
+                        r = src[y, x, 2]
+                        for sy in range(scale):
+                            dy = y * scale + sy
+                            for sx in range(scale):
+                                dx = x * scale + sx
+                                dst[dx, dy, 0] = r
+                                dst[dx, dy, 1] = g
+                                dst[dx, dy, 2] = b
+            return render
+
+        rshift, gshift, bshift, amask = packing
+
+        @njit(parallel=True, fastmath=True, boundscheck=False, nogil=True)
+        def render(src, dst):
+            for y in prange(height):
+                dy = y * scale
+                for x in range(width):
+                    p = ((np.uint32(src[y, x, 2]) << rshift) |
+                         (np.uint32(src[y, x, 1]) << gshift) |
+                         (np.uint32(src[y, x, 0]) << bshift) | amask)
+                    for sx in range(scale):
+                        dst[x * scale + sx, dy] = p
+                for sy in range(1, scale):
+                    for dx in range(width * scale):
+                        dst[dx, dy + sy] = dst[dx, dy]
+        return render
+
+def bgr_to_rgb_upscale_numpy(src, dst, scale):
+    # NumPy version of make_render()'s per-channel kernel, done as
+    # scale*scale strided copies. The channel flip and transpose are views,
+    # so nothing is allocated.
+    rgb = src[:, :, ::-1].transpose(1, 0, 2)
+    for sy in range(scale):
+        for sx in range(scale):
+            dst[sx::scale, sy::scale] = rgb
+
+def bytes_queued(sock):
+    # Bytes waiting in the socket's receive queue (0 if we can't tell)
+    if fcntl is None:
+        return 0
+    return struct.unpack("i", fcntl.ioctl(sock.fileno(), termios.FIONREAD, b"\0" * 4))[0]
+
+def copy_rgb565(surface, src, width, height):
+    # Frames arrive tightly packed; SDL pads surface rows to 4 bytes, so odd
+    # widths have to be copied a row at a time
+    dst = memoryview(surface.get_buffer())
+    row = width * 2
+    pitch = surface.get_pitch()
+    if pitch == row:
+        dst[:] = src
+    else:
+        for y in range(height):
+            dst[y * pitch:y * pitch + row] = src[y * row:(y + 1) * row]
+    del dst
+
+def blit_scaled(screen, surface, display_surface, scale):
+    # SDL path: convert into the window's format, then scale into the window
+    if scale == 1:
+        screen.blit(surface, (0, 0))
+        return
+    display_surface.blit(surface, (0, 0))
+    pygame.transform.scale(display_surface, screen.get_size(), screen)
+
+def frame_id_newer(a, b):
+    # Serial number comparison so frame ids can wrap around
+    return 0 < ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+def control_closed(sock):
+    # Non-blocking EOF check on the TCP connection (used in UDP mode, where
+    # the frame socket cannot tell us the server went away)
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and not sock.recv(1, socket.MSG_PEEK)
+    except OSError:
+        return True
+
+class FrameReceiver(threading.Thread):
+    # Receives frames on a background thread into a triple buffer carved out
+    # of one mmap: one slot being received, one being rendered and one
+    # holding the newest finished frame. Receiving never waits on rendering
+    # and the renderer always picks up the newest frame. Slots change owner
+    # by swapping indices under self.lock; pixel data is never copied.
+    def __init__(self, sock, nbytes):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.nbytes = nbytes
+        self.ring = mmap.mmap(-1, RING_SLOTS * nbytes)
+        ring_mv = memoryview(self.ring)
+        self.bufs = [ring_mv[i * nbytes:(i + 1) * nbytes] for i in range(RING_SLOTS)]
+        self.lock = threading.Lock()
+        self.new_frame = threading.Event()
+        self.write_slot = 0
+        self.fresh_slot = 1
+        self.read_slot = 2
+        self.fresh = False
+        self.connected = True
+        self.error = None
+
+    def run(self):
+        # Frames still to receive over from the last frames_queued() snapshot.
+        # The count is taken once per published frame, so a socket that stays
+        # backed up can delay publishing but never stop it.
+        skip = None
+        try:
+            while self.receive(self.bufs[self.write_slot]):
+                if skip is None:
+                    skip = self.frames_queued()
+                if skip:
+                    # Burst: this frame is already stale, so receive over it
+                    # instead of waking the renderer for it
+                    skip -= 1
+                    continue
+                skip = None
+                with self.lock:
+                    self.write_slot, self.fresh_slot = self.fresh_slot, self.write_slot
+                    self.fresh = True
+                self.new_frame.set()
+        except OSError as e:
+            self.error = e
+        self.connected = False
+        self.new_frame.set()
+
+    def acquire(self, timeout):
+        # Waits up to timeout for a frame newer than the last one returned.
+        # Returns its slot index, owned by the caller until the next call,
+        # or None.
+        if not self.new_frame.wait(timeout):
             return None
-        data.extend(packet)
-    return data
+        with self.lock:
+            self.new_frame.clear()
+            if not self.fresh:
+                return None
+            self.read_slot, self.fresh_slot = self.fresh_slot, self.read_slot
+            self.fresh = False
+            return self.read_slot
+
+    def receive(self, mv):
+        return recv_frame(self.sock, mv, self.nbytes)
+
+    def frames_queued(self):
+        # Whole frames already waiting in the socket. Partial ones don't
+        # count: blocking on them would delay the frame we already have
+        return bytes_queued(self.sock) // self.nbytes
+
+class UdpFrameReceiver(FrameReceiver):
+    # Reassembles FRAME_HDR-framed datagrams into the same triple-buffer
+    # slots. A frame is published only once every chunk is in; chunks of a
+    # frame older than the one in progress (or already shown) are dropped,
+    # and a newer frame abandons an incomplete one, since stale is worse
+    # than skipped.
+    def __init__(self, sock, nbytes):
+        super().__init__(sock, nbytes)
+        self.chunk_count = -(-nbytes // UDP_CHUNK_BYTES)
+        self.pkt = bytearray(FRAME_HDR.size + UDP_CHUNK_BYTES)
+        self.seen = bytearray(self.chunk_count)
+        self.none_seen = bytes(self.chunk_count)
+        self.last_id = None
+
+    def frames_queued(self):
+        # receive() already abandons frames overtaken by newer ones
+        return 0
+
+    def receive(self, mv):
+        pkt_mv = memoryview(self.pkt)
+        hdr = FRAME_HDR.size
+        cur_id = None
+        got = 0
+        while True:
+            k = self.sock.recv_into(pkt_mv)
+            if k <= hdr:
+                continue
+            frame_id, idx, count = FRAME_HDR.unpack_from(self.pkt)
+            if count != self.chunk_count or idx >= count:
+                continue
+            if self.last_id is not None and not frame_id_newer(frame_id, self.last_id):
+                continue
+            if cur_id is None or frame_id_newer(frame_id, cur_id):
+                cur_id = frame_id
+                got = 0
+                self.seen[:] = self.none_seen
+            elif frame_id != cur_id or self.seen[idx]:
+                continue
+            off = idx * UDP_CHUNK_BYTES
+            n = min(k - hdr, self.nbytes - off)
+            mv[off:off + n] = pkt_mv[hdr:hdr + n]
+            self.seen[idx] = 1
+            got += 1
+            if got == count:
+                self.last_id = frame_id
+                return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="DOOM stream viewer (TCP, or UDP with --udp)")
+    parser.add_argument("--ip", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--width", type=int, default=WIDTH)
+    parser.add_argument("--height", type=int, default=HEIGHT)
+    parser.add_argument("--scale", type=int, default=SCALE,
+                        help="integer upscale done on the CPU; 0 scales on the GPU")
+    parser.add_argument("--bpp", type=int, choices=(24, 16), default=24,
+                        help="wire format; 16 needs the server started with -rgb565")
+    parser.add_argument("--udp", action="store_true",
+                        help="receive frames as UDP datagrams (TCP carries input only)")
+    parser.add_argument("--cpu", type=parse_cpu_list, default=None,
+                        help="pin the viewer to these CPUs, e.g. 2-7 or 2,4-7: "
+                             "cores of the chiplet whose first listed core "
+                             "services the NIC's RX queue IRQ")
+    return parser.parse_args()
+
+def parse_cpu_list(text):
+    # "2-7" or "2,4-7" -> {2, 4, 5, 6, 7}, in the style of taskset -c
+    cpus = []
+    try:
+        for part in text.split(","):
+            first, dash, last = part.partition("-")
+            first = int(first)
+            last = int(last) if dash else first
+            if last < first:
+                raise ValueError
+            cpus.extend(range(first, last + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid CPU list: {text!r}")
+    return cpus
+
+def pin_to_cpu(sock, cpus):
+    # Keep the viewer and the kernel's RX processing on the same chiplet.
+    # Pin to a set of cores, not one: the receive thread inherits the mask
+    # and has to run alongside rendering. The socket is steered to the
+    # first listed core, which should be the one taking the RX IRQ.
+    if not hasattr(os, "sched_setaffinity"):
+        print("--cpu is only supported on Linux, ignoring")
+        return
+    os.sched_setaffinity(0, set(cpus))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_INCOMING_CPU, cpus[0])
+    except OSError:
+        pass
+    print(f"Pinned to CPUs {sorted(set(cpus))}")
+
+def close_sockets(sock, frame_sock):
+    if frame_sock is not sock:
+        frame_sock.close()
+    sock.close()
 
 def main():
+    args = parse_args()
     pygame.init()
-    
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("Doom TCP Stream (24-bit Stable)")
-    clock = pygame.time.Clock()
+    # Only queue the events we handle, so idle mouse/window/text events
+    # aren't turned into Python objects every frame. No key repeat: DOOM
+    # tracks held keys itself from KEYDOWN/KEYUP.
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP])
+    pygame.key.set_repeat(0)
+
+    width, height = args.width, args.height
+    if args.scale == 0:
+        # SDL uploads the native frame as a texture and the GPU scales it to
+        # the window. No vsync: the stream paces presentation.
+        scale = 1
+        screen = pygame.display.set_mode((width, height),
+                                         pygame.SCALED | pygame.DOUBLEBUF, vsync=0)
+    else:
+        scale = args.scale
+        screen = pygame.display.set_mode((width * scale, height * scale))
+    transport = "UDP" if args.udp else "TCP"
+    pygame.display.set_caption(f"Doom {transport} Stream ({args.bpp}-bit)")
+
+    rgb565 = args.bpp == 16
+    render = None
+    if HAVE_NUMBA and not rgb565:
+        # Geometry is fixed for the session, so specialise the kernel for it.
+        # With a 32-bit window, pack straight into mapped pixels.
+        packing = None
+        render_view = '3'
+        if screen.get_bytesize() == 4:
+            packing = screen.get_shifts()[:3] + (screen.get_masks()[3],)
+            render_view = '2'
+        render = make_render(width, height, scale, packing)
+        # Compile before connecting (drawing a black frame) rather than
+        # stalling on the first live frames
+        dst = np.asarray(screen.get_view(render_view))
+        render(np.zeros((height, width, 3), np.uint8), dst)
+        del dst
 
-    print(f"Connecting to {SERVER_IP}:{SERVER_PORT}...")
+    print(f"Connecting to {args.ip}:{args.port}...")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    frame_sock = sock
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((SERVER_IP, SERVER_PORT))
+        # Must be set before connect so the TCP window scale is negotiated for it
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_BYTES)
+        sock.connect((args.ip, args.port))
         sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         print("Connected!")
+        if args.udp:
+            frame_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            frame_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_BYTES)
+            frame_sock.bind(("", 0))
+            frame_sock.sendto(UDP_HELLO, (args.ip, args.port))
     except Exception as e:
         print(f"Connection failed: {e}")
+        close_sockets(sock, frame_sock)
         return
 
+    if args.cpu is not None:
+        try:
+            pin_to_cpu(frame_sock, args.cpu)
+        except OSError as e:
+            print(f"Cannot pin to CPUs {args.cpu}: {e}")
+            close_sockets(sock, frame_sock)
+            return
+
+    # Frame buffers live for the whole session. The views/surfaces wrap them
+    # without copying, so each recv_into lands directly in what we render.
+    frame_bytes = width * height * args.bpp // 8
+    if args.udp:
+        receiver = UdpFrameReceiver(frame_sock, frame_bytes)
+    else:
+        receiver = FrameReceiver(sock, frame_bytes)
+    if rgb565:
+        # SDL has no RGB565 frombuffer format, so 16-bit frames are copied
+        # into a matching surface and take the SDL path
+        rgb565_surface = pygame.Surface((width, height), 0, 16, RGB565_MASKS)
+    elif np is not None:
+        frame_srcs = [np.frombuffer(buf, np.uint8).reshape(height, width, 3)
+                      for buf in receiver.bufs]
+    else:
+        doom_surfaces = [pygame.image.frombuffer(buf, (width, height), "BGR")
+                         for buf in receiver.bufs]
+    if rgb565 or np is None:
+        # Copy of the frame in the window's pixel format, so the scalers can
+        # write straight into the window and SDL stays on its fast blit path
+        display_surface = pygame.Surface((width, height)).convert(screen)
+
+    receiver.start()
     running = True
     while running:
+        # Collect this frame's key events and send them in one write
+        keybuf = bytearray()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
-                if event.key in KEY_MAP:
-                    doom_key = KEY_MAP[event.key]
+                doom_key = KEY_MAP.get(event.key, 0)
+                if doom_key:
                     pressed = 1 if event.type == pygame.KEYDOWN else 0
-                    try:
-                        sock.sendall(struct.pack('BB', doom_key, pressed))
-                    except:
-                        pass
+                    keybuf += struct.pack('BB', doom_key, pressed)
+        if keybuf:
+            try:
+                sock.sendall(keybuf)
+            except:
+                pass
         
-        try:
-            # Read 24-bit frame
-            frame_data = recvall(sock, TOTAL_BYTES)
-            if not frame_data:
+        # Wait for the next frame. Frame arrival paces the loop at the
+        # server's rate (no clock.tick() throttle); the short timeout only
+        # keeps input flowing if the stream stalls.
+        slot = receiver.acquire(FRAME_WAIT_S)
+        if slot is None:
+            if not receiver.connected or (args.udp and control_closed(sock)):
+                if receiver.error:
+                    print(f"Error: {receiver.error}")
                 print("Disconnected")
                 running = False
-                continue
+            continue
 
+        try:
             # Render
-            doom_surface = pygame.image.frombuffer(frame_data, (WIDTH, HEIGHT), "BGR")
-            screen.blit(doom_surface, (0, 0))
+            if rgb565:
+                copy_rgb565(rgb565_surface, receiver.bufs[slot], width, height)
+                blit_scaled(screen, rgb565_surface, display_surface, scale)
+            elif np is not None:
+                # Write straight into the window's pixel memory through the
+                # buffer protocol; the view locks the surface, so drop it
+                # before flipping.
+                if render is not None:
+                    dst = np.asarray(screen.get_view(render_view))
+                    render(frame_srcs[slot], dst)
+                else:
+                    dst = np.asarray(screen.get_view('3'))
+                    bgr_to_rgb_upscale_numpy(frame_srcs[slot], dst, scale)
+                del dst
+            else:
+                blit_scaled(screen, doom_surfaces[slot], display_surface, scale)
             pygame.display.flip()
-            
         except Exception as e:
             print(f"Error: {e}")
             running = False
 
-        clock.tick(120)
-
-    sock.close()
+    close_sockets(sock, frame_sock)
     pygame.quit()
     sys.exit()
 